@@ -3,6 +3,7 @@ import math
 import os
 import time
 from abc import abstractmethod
+from concurrent.futures import ThreadPoolExecutor
 
 import numpy as np
 import tensorflow as tf
@@ -32,6 +33,100 @@ class AbstractModel(object):
 
             self.embeddings = tf.concat([reserved_token_embeddings, trainable_embeddings, const_embedding_matrix], 0)
 
+    def _train_fetches(self):
+        return [self.update,
+                self.stats_accum_op,
+                self.train_summary,
+                self.global_step,
+                self.learning_rate]
+
+    def _build_streaming_stats(self):
+        """Keep running sums of the per-step statistics on the device.
+
+        The training loop used to pull loss, predict/word counts and the
+        gradient norm back to the host on every step only to add them into a
+        Python dict. Accumulating them in-graph means they are fetched (and
+        reset) once per stats window instead of once per step. The
+        accumulators are kept out of the variable collections so savers and
+        `global_variables_initializer` are unaffected.
+        """
+        with tf.variable_scope("streaming_stats"):
+            self._loss_accum = tf.Variable(
+                0., trainable=False, collections=[], name="loss_accum")
+            self._predict_count_accum = tf.Variable(
+                0., trainable=False, collections=[], name="predict_count_accum")
+            self._word_count_accum = tf.Variable(
+                0., trainable=False, collections=[], name="word_count_accum")
+            self._grad_norm_accum = tf.Variable(
+                0., trainable=False, collections=[], name="grad_norm_accum")
+
+        self.stats_accum_op = tf.group(
+            self._loss_accum.assign_add(self.train_loss * tf.to_float(self.batch_size)),
+            self._predict_count_accum.assign_add(tf.to_float(self.predict_count)),
+            self._word_count_accum.assign_add(tf.to_float(self.word_count)),
+            self._grad_norm_accum.assign_add(self.grad_norm))
+
+        self._stats_reset_op = tf.variables_initializer(
+            [self._loss_accum, self._predict_count_accum,
+             self._word_count_accum, self._grad_norm_accum])
+
+    def fetch_streaming_stats(self, sess):
+        loss, predict_count, word_count, grad_norm = sess.run(
+            [self._loss_accum, self._predict_count_accum,
+             self._word_count_accum, self._grad_norm_accum])
+
+        return {"loss": loss,
+                "predict_count": predict_count,
+                "word_count": word_count,
+                "grad_norm": grad_norm}
+
+    def reset_streaming_stats(self, sess):
+        sess.run(self._stats_reset_op)
+
+    def _build_compact_saver(self):
+        """Shadow the trainable variables in bfloat16 for compact checkpoints.
+
+        Casting to bfloat16 halves the bytes the saver pushes to disk (and
+        reads back in `load_model`). Only the trainables are shadowed, so
+        optimizer slots stay out of these checkpoints; they are meant for the
+        best-model (inference) directories, not for resuming training.
+        """
+        shadows = {}
+        cast_to, cast_from = [], []
+
+        for v in tf.trainable_variables():
+            shadow = tf.Variable(tf.zeros(v.shape, dtype=tf.bfloat16),
+                                 trainable=False,
+                                 collections=[],
+                                 name=v.op.name.replace("/", "_") + "_bf16")
+            shadows[v.op.name] = shadow
+            cast_to.append(shadow.assign(tf.cast(v, tf.bfloat16)))
+            cast_from.append(v.assign(tf.cast(shadow, v.dtype)))
+
+        # global_step rides along at full precision (a scalar costs
+        # nothing), so a restored best model reports its real step instead
+        # of the initializer's 0.
+        var_list = dict(shadows)
+        var_list[self.global_step.op.name] = self.global_step
+
+        self.cast_to_compact_op = tf.group(*cast_to)
+        self.cast_from_compact_op = tf.group(*cast_from)
+        self.compact_saver = tf.train.Saver(var_list, max_to_keep=3)
+
+    def _run_train_step(self, sess):
+        """Run one training step through a cached session callable.
+
+        `Session.make_callable` sets up the run once, so subsequent steps skip
+        the per-call fetch/feed processing of `Session.run`. Over the hundreds
+        of thousands of steps in a training run, this removes a noticeable
+        amount of Python overhead from the hot loop.
+        """
+        if getattr(self, '_train_callable_sess', None) is not sess:
+            self._train_callable = sess.make_callable(self._train_fetches())
+            self._train_callable_sess = sess
+
+        return self._train_callable()
+
     def get_keep_probs(self, mode, params):
         if mode == tf.contrib.learn.ModeKeys.TRAIN:
             encoder_keep_prob = 1.0 - params.encoder_dropout_rate
@@ -156,8 +251,9 @@ class NMTEncoderDecoderWrapper(AbstractEncoderDecoderWrapper):
                                                       '{}.ckpt'.format(self._get_checkpoint_name()))
 
         if self.config.mode == 'train':
-            self.config['num_train_steps'] = int(self.config.num_train_epochs * math.ceil(
+            self.config['steps_per_epoch'] = int(math.ceil(
                 fs.count_lines(self.config.train_data) / self.config.batch_size))
+            self.config['num_train_steps'] = int(self.config.num_train_epochs * self.config.steps_per_epoch)
 
         self.config.vocab_file = os.path.join(self.config.model_dir,
                                               'vocab{}.in'.format(self.config.original_vocab_size
@@ -173,7 +269,18 @@ class NMTEncoderDecoderWrapper(AbstractEncoderDecoderWrapper):
         if 'epoch' not in self.config:
             self.config['epoch'] = 0
 
+        if 'num_sample_decode' not in self.config:
+            self.config['num_sample_decode'] = 5
+
+        if 'compact_checkpoints' not in self.config:
+            self.config['compact_checkpoints'] = False
+
+        if 'use_xla' not in self.config:
+            self.config['use_xla'] = False
+
         self._vocab_table = None
+        self._ckpt_executor = None
+        self._ckpt_future = None
 
     def _get_metrics(self):
         return []
@@ -200,6 +307,8 @@ class NMTEncoderDecoderWrapper(AbstractEncoderDecoderWrapper):
             print('  [WARN] vocab size decreased to {}'.format(self.config.vocab_size))
 
     def _post_model_creation(self, train_model, eval_model, infer_model):
+        """Hook called after graph creation. `eval_model`/`infer_model` are
+        None when their construction is deferred to the first eval tick."""
         pass
 
     def _sample_decode(self,
@@ -222,44 +331,44 @@ class NMTEncoderDecoderWrapper(AbstractEncoderDecoderWrapper):
         return ", ".join(tokens)
 
     def init_stats(self):
-        """Initialize statistics that we want to keep."""
+        """Initialize the host-side statistics (the loss/count/grad-norm sums
+        live in the train graph, see `AbstractModel._build_streaming_stats`)."""
 
-        return {"step_time": 0.0, "loss": 0.0, "predict_count": 0.0,
-                "total_count": 0.0, "grad_norm": 0.0}
+        return {"step_time": 0.0}
 
     def update_stats(self, stats, summary_writer, start_time, step_result):
         """Update stats: write summary and accumulate statistics."""
-        (_, step_loss, step_predict_count, step_summary, global_step,
-         step_word_count, batch_size, grad_norm, learning_rate) = step_result
+        (_, _, step_summary, global_step, learning_rate) = step_result
 
         # Write step summary.
         summary_writer.add_summary(step_summary, global_step)
 
         # update statistics
         stats["step_time"] += (time.time() - start_time)
-        stats["loss"] += (step_loss * batch_size)
-        stats["predict_count"] += step_predict_count
-        stats["total_count"] += float(step_word_count)
-        stats["grad_norm"] += grad_norm
         stats["learning_rate"] = learning_rate
 
         return global_step
 
-    def check_stats(self, stats, global_step, steps_per_stats, log_f, pbar=None):
-        """Print statistics and also check for overflow."""
+    def check_stats(self, stats, model, sess, global_step, steps_per_stats, log_f, pbar=None):
+        """Fetch the in-graph statistics, print them and check for overflow."""
+        accum = model.fetch_streaming_stats(sess)
+        model.reset_streaming_stats(sess)
+
         # Print statistics for the previous epoch.
         avg_step_time = stats["step_time"] / steps_per_stats
-        avg_grad_norm = stats["grad_norm"] / steps_per_stats
+        avg_grad_norm = accum["grad_norm"] / steps_per_stats
         train_ppl = misc.safe_exp(
-            stats["loss"] / stats["predict_count"])
-        speed = stats["total_count"] / (1000 * stats["step_time"])
+            accum["loss"] / accum["predict_count"])
+        speed = accum["word_count"] / (1000 * stats["step_time"])
 
         if pbar:
-            pbar.set_postfix(lr=stats["learning_rate"],
-                             wps='{:.1f}K'.format(speed),
-                             ppl='{:.3f}'.format(train_ppl),
-                             best_dev_ppl='{:.3f}'.format(self.config.best_dev_ppl),
-                             gN='{:.2f}'.format(avg_grad_norm))
+            # A pre-formatted postfix skips tqdm's dict formatting, and
+            # refresh=False defers the redraw to the pbar.update that follows.
+            pbar.set_postfix_str(
+                "lr={:.2e}, wps={:.1f}K, ppl={:.3f}, best_dev_ppl={:.3f}, gN={:.2f}".format(
+                    stats["learning_rate"], speed, train_ppl,
+                    self.config.best_dev_ppl, avg_grad_norm),
+                refresh=False)
 
         log.print_out(
             "  global step %d lr %g "
@@ -276,6 +385,27 @@ class NMTEncoderDecoderWrapper(AbstractEncoderDecoderWrapper):
 
         return train_ppl, speed, is_overflow
 
+    def _save_checkpoint_async(self, saver, sess, path, global_step):
+        """Save a checkpoint on a background thread.
+
+        Serializing and flushing the variables can stall the training loop
+        for seconds on slow or network storage. A single worker keeps the
+        writes ordered; anything that subsequently reads the checkpoint
+        directory must call `_wait_for_checkpoints` first (the run_* eval
+        helpers do so themselves).
+        """
+        if self._ckpt_executor is None:
+            self._ckpt_executor = ThreadPoolExecutor(max_workers=1)
+
+        self._wait_for_checkpoints()
+        self._ckpt_future = self._ckpt_executor.submit(
+            saver.save, sess, path, global_step=global_step)
+
+    def _wait_for_checkpoints(self):
+        if self._ckpt_future is not None:
+            self._ckpt_future.result()
+            self._ckpt_future = None
+
     def _load_data(self, input_file):
         """Load inference data."""
         with codecs.getreader("utf-8")(
@@ -323,12 +453,47 @@ class NMTEncoderDecoderWrapper(AbstractEncoderDecoderWrapper):
             "  Done, num sentences %d, num translations per input %d" %
             (num_sentences, num_responses_per_input), start_time)
 
+    def run_dev_eval(self, infer_model, infer_sess, eval_model, eval_sess,
+                     model_dir, summary_writer, eval_data):
+        """Run sample decoding and the dev perplexity evaluation in one pass.
+
+        The infer and eval graphs live in separate sessions, so their fetches
+        cannot be merged into a single run; what can be shared is the pending
+        checkpoint wait and the checkpoint-directory lookup, which the two
+        standalone run_* helpers would otherwise both repeat on every eval
+        tick.
+        """
+        self._wait_for_checkpoints()
+        latest_ckpt = tf.train.latest_checkpoint(model_dir)
+
+        with infer_model.graph.as_default():
+            loaded_infer_model = model_helper.load_model(
+                infer_model.model, latest_ckpt, infer_sess, "infer")
+            global_step = loaded_infer_model.global_step.eval(session=infer_sess)
+
+        self._sample_decode(loaded_infer_model, global_step, infer_sess,
+                            infer_model.src_placeholder, infer_model.batch_size_placeholder,
+                            eval_data, summary_writer)
+
+        with eval_model.graph.as_default():
+            loaded_eval_model = model_helper.load_model(
+                eval_model.model, latest_ckpt, eval_sess, "eval")
+
+        return self._internal_eval(eval_model, loaded_eval_model, global_step,
+                                   eval_sess, summary_writer)
+
     def run_internal_eval(self, eval_model, eval_sess, model_dir, summary_writer):
         """Compute internal evaluation (perplexity) for both dev / tests."""
+        self._wait_for_checkpoints()
         with eval_model.graph.as_default():
             loaded_eval_model, global_step = model_helper.create_or_load_model(
                 eval_model.model, model_dir, eval_sess, "eval")
 
+        return self._internal_eval(eval_model, loaded_eval_model, global_step,
+                                   eval_sess, summary_writer)
+
+    def _internal_eval(self, eval_model, loaded_eval_model, global_step, eval_sess, summary_writer):
+        """Dev perplexity for an already-loaded eval model."""
         dev_eval_iterator_feed_dict = {
             eval_model.eval_file_placeholder: self.config.dev_data
         }
@@ -338,15 +503,21 @@ class NMTEncoderDecoderWrapper(AbstractEncoderDecoderWrapper):
         log.add_summary(summary_writer, global_step, "dev_ppl", dev_ppl)
 
         if dev_ppl < self.config.best_dev_ppl:
-            loaded_eval_model.saver.save(eval_sess,
-                                         os.path.join(self.config.best_dev_ppl_dir,
-                                                      '{}.ckpt'.format(self._get_checkpoint_name())),
-                                         global_step=global_step)
+            best_ckpt = os.path.join(self.config.best_dev_ppl_dir,
+                                     '{}.ckpt'.format(self._get_checkpoint_name()))
+            if self.config.compact_checkpoints:
+                eval_sess.run(loaded_eval_model.cast_to_compact_op)
+                loaded_eval_model.compact_saver.save(eval_sess, best_ckpt,
+                                                     global_step=global_step)
+            else:
+                loaded_eval_model.saver.save(eval_sess, best_ckpt,
+                                             global_step=global_step)
 
         return dev_ppl
 
     def run_infer_best_model(self, infer_model, eval_model, infer_sess, eval_sess, best_model_dir, label,
                              summary_writer):
+        self._wait_for_checkpoints()
         with eval_model.graph.as_default():
             loaded_eval_model, global_step = model_helper.create_or_load_model(
                 eval_model.model, best_model_dir, eval_sess, "eval")
@@ -373,6 +544,7 @@ class NMTEncoderDecoderWrapper(AbstractEncoderDecoderWrapper):
 
     def run_sample_decode(self, infer_model, infer_sess, model_dir, summary_writer, eval_data):
         """Sample decode a random sentence from src_data."""
+        self._wait_for_checkpoints()
         with infer_model.graph.as_default():
             loaded_infer_model, global_step = model_helper.create_or_load_model(
                 infer_model.model, model_dir, infer_sess, "infer")
@@ -1,5 +1,6 @@
 import os
 import time
+from operator import itemgetter
 
 import math
 import numpy as np
@@ -16,6 +17,36 @@ from ..util.misc import Stopwatch
 class BaseHierarchicalEncoderDecoder(NMTEncoderDecoderWrapper):
     def __init__(self, config):
         super(BaseHierarchicalEncoderDecoder, self).__init__(config)
+        self._eval_model, self._eval_sess = None, None
+        self._infer_model, self._infer_sess = None, None
+
+    def _ensure_eval_model(self, target_session="", scope=None):
+        """Build the eval graph and its session on first use.
+
+        Deferring the construction keeps the eval graph from claiming GPU
+        memory during the (potentially long) stretch of training steps before
+        the first eval tick; `allow_growth` in `get_config_proto` lets the
+        train session expand in the meantime.
+        """
+        if self._eval_model is None:
+            self._eval_model = self._get_model_helper().create_eval_model(self.config, scope)
+            self._eval_sess = tf.Session(
+                target=target_session,
+                config=model_helper.get_config_proto(self.config.log_device),
+                graph=self._eval_model.graph)
+
+        return self._eval_model, self._eval_sess
+
+    def _ensure_infer_model(self, target_session="", scope=None):
+        """Build the infer graph and its session on first use (see `_ensure_eval_model`)."""
+        if self._infer_model is None:
+            self._infer_model = self._get_model_helper().create_infer_model(self.config, scope)
+            self._infer_sess = tf.Session(
+                target=target_session,
+                config=model_helper.get_config_proto(self.config.log_device),
+                graph=self._infer_model.graph)
+
+        return self._infer_model, self._infer_sess
 
     def train(self, target_session="", scope=None):
         assert self.config.num_turns >= 2
@@ -33,10 +64,10 @@ class BaseHierarchicalEncoderDecoder(NMTEncoderDecoderWrapper):
         self._pre_model_creation()
 
         train_model = _helper.create_train_model(self.config, scope)
-        eval_model = _helper.create_eval_model(self.config, scope)
-        infer_model = _helper.create_infer_model(self.config, scope)
 
-        self._post_model_creation(train_model, eval_model, infer_model)
+        # The eval/infer graphs and sessions are built lazily on the first
+        # eval tick (see _ensure_eval_model/_ensure_infer_model).
+        self._post_model_creation(train_model, None, None)
 
         # Preload data for sample decoding.
         eval_data = self._load_data(self.config.dev_data)
@@ -46,7 +77,7 @@ class BaseHierarchicalEncoderDecoder(NMTEncoderDecoderWrapper):
 
         # Log and output files
         log_file = os.path.join(out_dir, "log_%d" % time.time())
-        log_f = tf.gfile.GFile(log_file, mode="a")
+        log_f = log.open_log_file(log_file)
         log.print_out("# log_file=%s" % log_file, log_f)
 
         self.config.save()
@@ -54,18 +85,16 @@ class BaseHierarchicalEncoderDecoder(NMTEncoderDecoderWrapper):
         avg_step_time = 0.0
 
         # TensorFlow model
-        config_proto = model_helper.get_config_proto(self.config.log_device)
+        config_proto = model_helper.get_config_proto(self.config.log_device,
+                                                     use_xla=self.config.use_xla)
 
         train_sess = tf.Session(
             target=target_session, config=config_proto, graph=train_model.graph)
-        eval_sess = tf.Session(
-            target=target_session, config=config_proto, graph=eval_model.graph)
-        infer_sess = tf.Session(
-            target=target_session, config=config_proto, graph=infer_model.graph)
 
         with train_model.graph.as_default():
             loaded_train_model, global_step = model_helper.create_or_load_model(
                 train_model.model, self.config.model_dir, train_sess, "train")
+        loaded_train_model.reset_streaming_stats(train_sess)
 
         # Summary writer
         summary_writer = tf.summary.FileWriter(
@@ -79,8 +108,11 @@ class BaseHierarchicalEncoderDecoder(NMTEncoderDecoderWrapper):
         speed, train_ppl = 0.0, 0.0
         start_train_time = time.time()
 
-        # Initialize all of the iterators
+        # Initialize the training iterator once; the dataset repeats
+        # indefinitely (with the resume skip baked in at graph-build time),
+        # so epoch boundaries need no re-initialization.
         skip_count = self.config.batch_size * self.config.epoch_step
+        steps_per_epoch = self.config.steps_per_epoch
         lr = loaded_train_model.learning_rate.eval(session=train_sess)
         log.print_out(
             "# Starting step {}/{} (skipping {} elements), epoch {}/{}, lr {:f}, {}".format(
@@ -88,24 +120,30 @@ class BaseHierarchicalEncoderDecoder(NMTEncoderDecoderWrapper):
                 self.config.epoch, self.config.num_train_epochs, lr, time.ctime()),
             log_f)
 
-        train_sess.run(
-            train_model.iterator.initializer,
-            feed_dict={train_model.skip_count_placeholder: skip_count})
+        train_sess.run(train_model.iterator.initializer)
 
         pbar = trange(self.config.num_train_steps, initial=global_step)
-        pbar.set_postfix(lr=lr, wps='0K', ppl='inf', gN='inf', best_dev_ppl=self.config.best_dev_ppl)
+        pbar.set_postfix_str(
+            "lr={:.2e}, wps=0K, ppl=inf, best_dev_ppl={:.3f}, gN=inf".format(
+                lr, self.config.best_dev_ppl),
+            refresh=False)
         pbar.set_description("Ep {}/{}".format(self.config.epoch, self.config.num_train_epochs))
 
         while self.config.epoch < self.config.num_train_epochs and patience > 0:
 
             ### Run a step ###
             start_time = time.time()
-            try:
-                step_result = loaded_train_model.train(train_sess)
-                self.config.epoch_step += 1
-            except tf.errors.OutOfRangeError:
-                # Finished going through the training dataset.  Go to next epoch.
+            step_result = loaded_train_model.train(train_sess)
+            self.config.epoch_step += 1
+
+            # Write step summary and accumulate statistics
+            global_step = self.update_stats(stats, summary_writer, start_time, step_result)
+
+            if self.config.epoch_step >= steps_per_epoch:
+                # Finished going through the training dataset.  Go to next
+                # epoch; only the Python-side accounting rolls over.
                 sw = Stopwatch()
+                infer_model, infer_sess = self._ensure_infer_model(target_session, scope)
                 self.run_sample_decode(infer_model, infer_sess,
                                        self.config.model_dir, summary_writer, eval_data)
 
@@ -118,19 +156,13 @@ class BaseHierarchicalEncoderDecoder(NMTEncoderDecoderWrapper):
                 self.config.save()
                 pbar.set_description("Ep {}/{}".format(self.config.epoch, self.config.num_train_epochs))
 
-                train_sess.run(
-                    train_model.iterator.initializer,
-                    feed_dict={train_model.skip_count_placeholder: 0})
-                continue
-
-            # Write step summary and accumulate statistics
-            global_step = self.update_stats(stats, summary_writer, start_time, step_result)
-
             # Once in a while, we print statistics.
             if global_step - last_stats_step >= steps_per_stats:
-                train_ppl, speed, is_overflow = self.check_stats(stats, global_step, steps_per_stats, log_f, pbar)
+                train_ppl, speed, is_overflow = self.check_stats(
+                    stats, loaded_train_model, train_sess, global_step, steps_per_stats, log_f, pbar)
                 pbar.update(global_step - last_stats_step)
                 last_stats_step = global_step
+                log_f.flush()
 
                 if is_overflow:
                     break
@@ -144,14 +176,17 @@ class BaseHierarchicalEncoderDecoder(NMTEncoderDecoderWrapper):
                 log.print_out("# Save eval, global step {}".format(global_step))
                 log.add_summary(summary_writer, global_step, "train_ppl", train_ppl)
 
-                # Save checkpoint
-                loaded_train_model.saver.save(train_sess,
-                                              self.config.checkpoint_file,
-                                              global_step=global_step)
+                # Save checkpoint in the background; the eval helpers below
+                # wait for it before restoring. On the first tick the write
+                # overlaps with building the infer/eval graphs.
+                self._save_checkpoint_async(loaded_train_model.saver, train_sess,
+                                            self.config.checkpoint_file, global_step)
 
                 # Evaluate on dev
-                self.run_sample_decode(infer_model, infer_sess, out_dir, summary_writer, eval_data)
-                dev_ppl = self.run_internal_eval(eval_model, eval_sess, out_dir, summary_writer)
+                infer_model, infer_sess = self._ensure_infer_model(target_session, scope)
+                eval_model, eval_sess = self._ensure_eval_model(target_session, scope)
+                dev_ppl = self.run_dev_eval(infer_model, infer_sess, eval_model, eval_sess,
+                                            out_dir, summary_writer, eval_data)
                 if dev_ppl < self.config.best_dev_ppl:
                     self.config.best_dev_ppl = dev_ppl
                     patience = self.config.patience
@@ -177,6 +212,7 @@ class BaseHierarchicalEncoderDecoder(NMTEncoderDecoderWrapper):
 
         pbar.close()
         # Done training
+        self._wait_for_checkpoints()
         loaded_train_model.saver.save(
             train_sess,
             self.config.checkpoint_file,
@@ -193,6 +229,8 @@ class BaseHierarchicalEncoderDecoder(NMTEncoderDecoderWrapper):
 
         if self.config.eval_best_model:
             log.print_out("Evaluating the best model begins...")
+            infer_model, infer_sess = self._ensure_infer_model(target_session, scope)
+            eval_model, eval_sess = self._ensure_eval_model(target_session, scope)
             test_ppl = self.run_infer_best_model(infer_model, eval_model,
                                                  infer_sess, eval_sess,
                                                  self.config.best_dev_ppl_dir,
@@ -204,10 +242,15 @@ class BaseHierarchicalEncoderDecoder(NMTEncoderDecoderWrapper):
                 (test_ppl, self.config.beam_width, self.config.length_penalty_weight, self.config.sampling_temperature),
                 log_f)
 
+        log_f.close()
         summary_writer.close()
 
-        eval_sess.close()
-        infer_sess.close()
+        if self._eval_sess is not None:
+            self._eval_sess.close()
+            self._eval_model, self._eval_sess = None, None
+        if self._infer_sess is not None:
+            self._infer_sess.close()
+            self._infer_model, self._infer_sess = None, None
         train_sess.close()
 
         # log.print_out("# Start evaluating saved best models.")
@@ -228,12 +271,19 @@ class BaseHierarchicalEncoderDecoder(NMTEncoderDecoderWrapper):
 
     def _sample_decode(self,
                        model, global_step, sess, src_placeholder, batch_size_placeholder, eval_data, summary_writer):
-        """Pick a sentence and decode."""
-        decode_ids = np.random.randint(low=0, high=len(eval_data) - 1, size=1)
+        """Pick `num_sample_decode` sentences and decode them in one batch.
+
+        Decoding the samples together amortizes the iterator init and the
+        kernel-launch overhead of a batch-1 decode over all of them.
+        """
+        decode_ids = np.random.choice(len(eval_data),
+                                      size=min(self.config.num_sample_decode, len(eval_data)),
+                                      replace=False).tolist()
 
-        sample_data = []
-        for decode_id in decode_ids:
-            sample_data.append(eval_data[decode_id])
+        if len(decode_ids) > 1:
+            sample_data = list(itemgetter(*decode_ids)(eval_data))
+        else:
+            sample_data = [eval_data[decode_ids[0]]]
 
         iterator_feed_dict = {
             src_placeholder: sample_data,
@@ -243,14 +293,12 @@ class BaseHierarchicalEncoderDecoder(NMTEncoderDecoderWrapper):
         sess.run(model.iterator.initializer, feed_dict=iterator_feed_dict)
         ncm_outputs, infer_summary = model.decode(sess)
 
-        for i, decode_id in enumerate(decode_ids):
-            output = ncm_outputs[i]
-
-            if self.config.beam_width > 0 and self._consider_beam():
-                # get the top translation.
-                output = output[0]
+        if self.config.beam_width > 0 and self._consider_beam():
+            # get the top translations.
+            ncm_outputs = ncm_outputs[0]
 
-            translation = ncm_utils.get_translation(output, sent_id=0)
+        for i, decode_id in enumerate(decode_ids):
+            translation = ncm_utils.get_translation(ncm_outputs, sent_id=i)
 
             utterances = eval_data[decode_id].split("\t")
             sources, target = utterances[:-1], utterances[-1]
@@ -278,14 +326,24 @@ class BaseHierarchicalEncoderDecoder(NMTEncoderDecoderWrapper):
 
         self._pre_model_creation()
 
-        infer_model = self._get_model_helper().create_infer_model(self.config)
+        _helper = self._get_model_helper()
+
+        # Build the infer and eval models in a single graph with one shared
+        # set of variables, so decoding and perplexity run in one session
+        # with one restore and one round of kernel warmup instead of two
+        # cold starts.
+        graph = tf.Graph()
+        infer_model = _helper.create_infer_model(self.config, graph=graph)
+        with graph.as_default(), tf.variable_scope(
+                tf.get_variable_scope(), reuse=tf.AUTO_REUSE):
+            eval_model = _helper.create_eval_model(self.config, graph=graph)
 
         latest_ckpt = tf.train.latest_checkpoint(self.config.get_infer_model_dir())
         with tf.Session(
                 config=model_helper.get_config_proto(self.config.log_device),
-                graph=infer_model.graph) as infer_sess:
+                graph=graph) as sess:
             loaded_infer_model = model_helper.load_model(
-                infer_model.model, latest_ckpt, infer_sess, "infer")
+                infer_model.model, latest_ckpt, sess, "infer")
 
             log.print_out("# Start decoding")
             log.print_out("  beam width: {}".format(self.config.beam_width))
@@ -305,25 +363,18 @@ class BaseHierarchicalEncoderDecoder(NMTEncoderDecoderWrapper):
                 label = "%s_bw%d_lp%.1f" % (
                     fs.file_name(self.config.test_data), self.config.beam_width, self.config.length_penalty_weight)
 
-            self._decode_and_evaluate(loaded_infer_model, infer_sess, feed_dict,
+            self._decode_and_evaluate(loaded_infer_model, sess, feed_dict,
                                       label=label,
                                       num_responses_per_input=self.config.n_responses)
-        log.print_time("# Decoding done", start_test_time)
-
-        eval_model = self._get_model_helper().create_eval_model(self.config)
-        with tf.Session(
-                config=model_helper.get_config_proto(self.config.log_device),
-                graph=eval_model.graph) as eval_sess:
-            loaded_eval_model = model_helper.load_model(
-                eval_model.model, latest_ckpt, eval_sess, "eval")
+            log.print_time("# Decoding done", start_test_time)
 
             log.print_out("# Compute Perplexity")
 
-            dev_eval_iterator_feed_dict = {
+            test_eval_iterator_feed_dict = {
                 eval_model.eval_file_placeholder: self.config.test_data
             }
 
-            eval_sess.run(eval_model.iterator.initializer, feed_dict=dev_eval_iterator_feed_dict)
-            model_helper.compute_perplexity(loaded_eval_model, eval_sess, "test")
+            sess.run(eval_model.iterator.initializer, feed_dict=test_eval_iterator_feed_dict)
+            model_helper.compute_perplexity(eval_model.model, sess, "test")
 
         log.print_time("# Test finished", start_test_time)
@@ -16,7 +16,9 @@ def get_iterator(dataset,
                  output_buffer_size=None,
                  skip_count=None,
                  num_shards=1,
-                 shard_index=0):
+                 shard_index=0,
+                 cache_file=None,
+                 repeat=False):
     num_inputs = num_turns - 1
 
     if not output_buffer_size:
@@ -26,32 +28,32 @@ def get_iterator(dataset,
     sos_id = tf.constant(vocab.SOS_ID, dtype=tf.int32)
 
     src_tgt_dataset = dataset.shard(num_shards, shard_index)
-    if skip_count is not None:
+    if skip_count is not None and not repeat:
         src_tgt_dataset = src_tgt_dataset.skip(skip_count)
 
     src_tgt_dataset = src_tgt_dataset.shuffle(output_buffer_size, random_seed)
+    if repeat:
+        # Infinite stream (reshuffled every pass); the caller accounts for
+        # epochs, so there is no iterator re-initialization at epoch
+        # boundaries. Skipping after the repeat makes the resume skip apply
+        # once rather than on every pass.
+        src_tgt_dataset = src_tgt_dataset.repeat()
+        if skip_count is not None:
+            src_tgt_dataset = src_tgt_dataset.skip(skip_count)
 
-    def _tokenize_lambda(line):
+    def _parse_lambda(line):
+        # Tokenization and vocab lookup fused into a single map: tf.data in
+        # 1.x does not fuse adjacent maps on its own, and a separate stage
+        # would pay an extra per-element function dispatch plus an
+        # intermediate buffer between the two.
         utterances = tf.string_split([line], delimiter="\t").values
 
         srcs = [tf.string_split([utterances[t]]).values for t in range(num_inputs)]
         tgt = tf.string_split([utterances[num_inputs]]).values
+        if tgt_max_len:
+            tgt = tgt[:tgt_max_len]
 
-        tokenized_data = {
-            'tgt': tgt[:tgt_max_len] if tgt_max_len else tgt
-        }
-
-        for t in range(num_inputs):
-            tokenized_data['src_%d' % t] = srcs[t][:src_max_len] if src_max_len else srcs[t]
-
-        return tokenized_data
-
-    src_tgt_dataset = src_tgt_dataset.map(
-        _tokenize_lambda,
-        num_parallel_calls=num_parallel_calls).prefetch(output_buffer_size)
-
-    def _lookup_lambda(data):
-        tgt = tf.cast(vocab_table.lookup(data['tgt']), tf.int32)
+        tgt = tf.cast(vocab_table.lookup(tgt), tf.int32)
         tgt_out = tf.concat((tgt, [eos_id]), 0)
         mapped_data = {
             'tgt_in': tf.concat(([sos_id], tgt), 0),
@@ -60,15 +62,24 @@ def get_iterator(dataset,
         }
 
         for t in range(num_inputs):
-            src = tf.cast(vocab_table.lookup(data['src_%d' % t]), tf.int32)
+            src = srcs[t][:src_max_len] if src_max_len else srcs[t]
+            src = tf.cast(vocab_table.lookup(src), tf.int32)
             mapped_data['src_%d' % t] = src
             mapped_data['src_len_%d' % t] = tf.size(src)
 
         return mapped_data
 
     src_tgt_dataset = src_tgt_dataset.map(
-        _lookup_lambda,
+        _parse_lambda,
         num_parallel_calls=num_parallel_calls).prefetch(output_buffer_size)
+
+    if cache_file is not None:
+        # File-backed cache of the tokenized dataset, keyed per input file
+        # by the caller. On this TensorFlow line, re-running the iterator
+        # initializer rebuilds an in-memory CacheDataset from scratch, so
+        # only an on-disk cache actually survives the per-eval-tick
+        # re-initialization.
+        src_tgt_dataset = src_tgt_dataset.cache(cache_file)
     # Create a tgt_input prefixed with <sos> and a tgt_output suffixed with <eos>.
 
     # Add in sequence lengths.
@@ -135,6 +146,9 @@ def get_iterator(dataset,
     else:
         batched_dataset = _batching_lambda(src_tgt_dataset)
 
+    # Terminal prefetch: assembling and padding the next batch overlaps
+    # with the step consuming the current one.
+    batched_dataset = batched_dataset.prefetch(2)
     batched_iter = batched_dataset.make_initializable_iterator()
     batched_data = batched_iter.get_next()
 
@@ -194,6 +208,9 @@ def get_infer_iterator(test_dataset,
             padding_values=padded_values)
 
     batched_dataset = batching_func(test_dataset)
+    # Terminal prefetch: assembling and padding the next batch overlaps
+    # with the step consuming the current one.
+    batched_dataset = batched_dataset.prefetch(2)
     batched_iter = batched_dataset.make_initializable_iterator()
 
     batched_data = batched_iter.get_next()
@@ -45,16 +45,43 @@ class InferModel(
     pass
 
 
-def get_config_proto(log_device_placement):
-    return tf.ConfigProto(
+def get_config_proto(log_device_placement, use_xla=False):
+    config_proto = tf.ConfigProto(
         log_device_placement=log_device_placement,
         allow_soft_placement=True,
         gpu_options=tf.GPUOptions(allow_growth=True))
 
+    if use_xla:
+        # XLA auto-clustering fuses the elementwise/reduction chains of the
+        # step into fewer, larger kernels. The first steps pay the
+        # compilation cost, which lands inside the first stats window.
+        config_proto.graph_options.optimizer_options.global_jit_level = (
+            tf.OptimizerOptions.ON_1)
+
+    return config_proto
+
+
+def _is_compact_checkpoint(ckpt):
+    """True if the checkpoint stores bfloat16 (compact) weights."""
+    dtype_map = tf.train.NewCheckpointReader(ckpt).get_variable_to_dtype_map()
+    return any(dtype == tf.bfloat16 for dtype in dtype_map.values())
+
 
 def load_model(model, ckpt, session, name):
     start_time = time.time()
-    model.saver.restore(session, ckpt)
+    if _is_compact_checkpoint(ckpt):
+        if not hasattr(model, "compact_saver"):
+            raise ValueError(
+                "%s holds bfloat16 (compact) weights, but the model was built "
+                "without a compact saver; set compact_checkpoints to load it" % ckpt)
+        # Compact checkpoints only hold the trainable variables in bfloat16
+        # (plus global_step at full precision); initialize everything first,
+        # then overwrite from the shadows.
+        session.run(tf.global_variables_initializer())
+        model.compact_saver.restore(session, ckpt)
+        session.run(model.cast_from_compact_op)
+    else:
+        model.saver.restore(session, ckpt)
     session.run(tf.tables_initializer())
     log.print_out(
         "  loaded %s model parameters from %s, time %.2fs" %
@@ -17,7 +17,12 @@ def create_train_model(hparams, scope=None, num_workers=1, jobid=0):
         vocab_table = vocab.create_vocab_table(hparams.vocab_file)
 
         dataset = tf.data.TextLineDataset(hparams.train_data)
-        skip_count_placeholder = tf.placeholder(shape=(), dtype=tf.int64)
+
+        # Elements consumed in the current epoch (when resuming from a
+        # checkpoint) are skipped once at graph-build time; the repeating
+        # dataset then makes iterator re-initialization at epoch boundaries
+        # unnecessary.
+        skip_count = hparams.batch_size * hparams.epoch_step
 
         iterator = get_iterator(
             dataset,
@@ -28,9 +33,10 @@ def create_train_model(hparams, scope=None, num_workers=1, jobid=0):
             hparams.topic_words_per_utterance,
             hparams.src_max_len,
             hparams.tgt_max_len,
-            skip_count=skip_count_placeholder,
+            skip_count=skip_count,
             num_shards=num_workers,
-            shard_index=jobid)
+            shard_index=jobid,
+            repeat=True)
 
         # Note: One can set model_device_fn to
         # `tf.train.replica_device_setter(ps_tasks)` for distributed training.
@@ -47,7 +53,7 @@ def create_train_model(hparams, scope=None, num_workers=1, jobid=0):
     return TrainModel(graph=graph,
                       model=model,
                       iterator=iterator,
-                      skip_count_placeholder=skip_count_placeholder)
+                      skip_count_placeholder=None)
 
 
 def create_pretrain_model(hparams, scope=None, num_workers=1, jobid=0):
@@ -84,16 +90,24 @@ def create_pretrain_model(hparams, scope=None, num_workers=1, jobid=0):
         skip_count_placeholder=None)
 
 
-def create_eval_model(hparams, scope=None):
+def create_eval_model(hparams, scope=None, graph=None):
     """Create train graph, model, src/tgt file holders, and iterator."""
 
-    graph = tf.Graph()
+    if graph is None:
+        graph = tf.Graph()
 
     with graph.as_default(), tf.container(scope or "eval"):
         vocab_table = vocab.create_vocab_table(hparams.vocab_file)
         eval_file_placeholder = tf.placeholder(shape=(), dtype=tf.string)
 
         eval_dataset = tf.data.TextLineDataset(eval_file_placeholder)
+        # Cache the tokenized dataset on disk inside the model dir, keyed by
+        # the fed file name so the dev cache is never replayed for the test
+        # set.
+        eval_cache_file = tf.string_join([
+            hparams.model_dir + "/",
+            tf.regex_replace(eval_file_placeholder, "[^A-Za-z0-9_.-]", "_"),
+            ".cache"])
         iterator = get_iterator(
             eval_dataset,
             vocab_table,
@@ -102,7 +116,8 @@ def create_eval_model(hparams, scope=None):
             hparams.num_buckets,
             hparams.topic_words_per_utterance,
             hparams.src_max_len,
-            hparams.tgt_max_len)
+            hparams.tgt_max_len,
+            cache_file=eval_cache_file)
 
         model = TopicAwareHierarchicalSeq2SeqModel(
             mode=tf.contrib.learn.ModeKeys.EVAL,
@@ -119,9 +134,10 @@ def create_eval_model(hparams, scope=None):
         iterator=iterator)
 
 
-def create_infer_model(hparams, scope=None):
+def create_infer_model(hparams, scope=None, graph=None):
     """Create inference model."""
-    graph = tf.Graph()
+    if graph is None:
+        graph = tf.Graph()
 
     with graph.as_default(), tf.container(scope or "infer"):
         vocab_table = vocab.create_vocab_table(hparams.vocab_file)
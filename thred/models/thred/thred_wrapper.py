@@ -1,4 +1,5 @@
 from os import path
+from operator import itemgetter
 
 import numpy as np
 
@@ -37,12 +38,15 @@ class TopicalHierarchicalEncoderDecoder(BaseHierarchicalEncoderDecoder):
 
     def _sample_decode(self,
                        model, global_step, sess, src_placeholder, batch_size_placeholder, eval_data, summary_writer):
-        """Pick a sentence and decode."""
-        decode_ids = np.random.randint(low=0, high=len(eval_data) - 1, size=1)
+        """Pick `num_sample_decode` sentences and decode them in one batch."""
+        decode_ids = np.random.choice(len(eval_data),
+                                      size=min(self.config.num_sample_decode, len(eval_data)),
+                                      replace=False).tolist()
 
-        sample_data = []
-        for decode_id in decode_ids:
-            sample_data.append(eval_data[decode_id])
+        if len(decode_ids) > 1:
+            sample_data = list(itemgetter(*decode_ids)(eval_data))
+        else:
+            sample_data = [eval_data[decode_ids[0]]]
 
         iterator_feed_dict = {
             src_placeholder: sample_data,
@@ -52,16 +56,14 @@ class TopicalHierarchicalEncoderDecoder(BaseHierarchicalEncoderDecoder):
         sess.run(model.iterator.initializer, feed_dict=iterator_feed_dict)
         ncm_outputs, infer_summary = model.decode(sess)
 
+        if self.config.beam_width > 0 and self._consider_beam():
+            # get the top translations.
+            ncm_outputs = ncm_outputs[0]
+
         for i, decode_id in enumerate(decode_ids):
             log.print_out("  # {}".format(decode_id))
 
-            output = ncm_outputs[i]
-
-            if self.config.beam_width > 0 and self._consider_beam():
-                # get the top translation.
-                output = output[0]
-
-            translation = ncm_utils.get_translation(output, sent_id=0)
+            translation = ncm_utils.get_translation(ncm_outputs, sent_id=i)
             delimited_sample = eval_data[decode_id].split("\t")
             utterances, topic = delimited_sample[:-1], delimited_sample[-1]
             sources, target = utterances[:-1], utterances[-1]
@@ -137,12 +137,17 @@ class TopicAwareSeq2SeqModel(AbstractModel):
                                                           tf.summary.scalar("train_loss", self.train_loss),
                                                       ] + grad_norm_summary)
 
+                # In-graph accumulators fetched once per stats window.
+                self._build_streaming_stats()
+
             if mode == tf.contrib.learn.ModeKeys.INFER:
                 self.infer_logits, self.sample_id = logits, sample_id
                 self.infer_summary = tf.no_op()
 
             # Saver
             self.saver = tf.train.Saver(tf.global_variables(), max_to_keep=3)
+            if mode != tf.contrib.learn.ModeKeys.TRAIN and params.get('compact_checkpoints', False):
+                self._build_compact_saver()
 
             # Print trainable variables
             if log_trainables:
@@ -380,15 +385,7 @@ class TopicAwareSeq2SeqModel(AbstractModel):
     def train(self, sess):
         assert self.mode == tf.contrib.learn.ModeKeys.TRAIN
 
-        return sess.run([self.update,
-                         self.train_loss,
-                         self.predict_count,
-                         self.train_summary,
-                         self.global_step,
-                         self.word_count,
-                         self.batch_size,
-                         self.grad_norm,
-                         self.learning_rate])
+        return self._run_train_step(sess)
 
     def eval(self, sess):
         assert self.mode == tf.contrib.learn.ModeKeys.EVAL
@@ -47,10 +47,11 @@ def create_train_model(hparams, scope=None, num_workers=1, jobid=0, extra_args=N
         skip_count_placeholder=skip_count_placeholder)
 
 
-def create_eval_model(hparams, scope=None):
+def create_eval_model(hparams, scope=None, graph=None):
     """Create train graph, model, src/tgt file holders, and iterator."""
     vocab_file = hparams.vocab_file
-    graph = tf.Graph()
+    if graph is None:
+        graph = tf.Graph()
 
     with graph.as_default(), tf.container(scope or "eval"):
         vocab_table = vocab.create_vocab_table(vocab_file)
@@ -77,9 +78,10 @@ def create_eval_model(hparams, scope=None):
         iterator=iterator)
 
 
-def create_infer_model(hparams, scope=None):
+def create_infer_model(hparams, scope=None, graph=None):
     """Create inference model."""
-    graph = tf.Graph()
+    if graph is None:
+        graph = tf.Graph()
     vocab_file = hparams.vocab_file
 
     with graph.as_default(), tf.container(scope or "infer"):
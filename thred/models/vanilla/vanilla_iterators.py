@@ -62,31 +62,29 @@ def get_iterator(dataset,
     src_tgt_dataset = src_tgt_dataset.filter(
         lambda src, tgt: tf.logical_and(tf.size(src) > 0, tf.size(tgt) > 0))
 
-    if src_max_len:
-        src_tgt_dataset = src_tgt_dataset.map(
-            lambda src, tgt: (src[:src_max_len], tgt),
-            num_parallel_calls=num_parallel_calls).prefetch(output_buffer_size)
-    if tgt_max_len:
-        src_tgt_dataset = src_tgt_dataset.map(
-            lambda src, tgt: (src, tgt[:tgt_max_len]),
-            num_parallel_calls=num_parallel_calls).prefetch(output_buffer_size)
-
-    # Convert the word strings to ids.  Word strings that are not in the
-    # vocab get the lookup table's default_value integer.
-    src_tgt_dataset = src_tgt_dataset.map(
-        lambda src, tgt: (tf.cast(vocab_table.lookup(src), tf.int32),
-                          tf.cast(vocab_table.lookup(tgt), tf.int32)),
-        num_parallel_calls=num_parallel_calls).prefetch(output_buffer_size)
-    # Create a tgt_input prefixed with <sos> and a tgt_output suffixed with <eos>.
-    src_tgt_dataset = src_tgt_dataset.map(
-        lambda src, tgt: (src,
-                          tf.concat(([sos_id], tgt), 0),
-                          tf.concat((tgt, [eos_id]), 0)),
-        num_parallel_calls=num_parallel_calls).prefetch(output_buffer_size)
-    # Add in sequence lengths.
+    def transform(src, tgt):
+        # Truncation, vocab lookup, the <sos>/<eos> decoration and the
+        # sequence lengths fused into a single map; tf.data in 1.x does not
+        # fuse adjacent maps on its own, and each removed stage also drops
+        # its per-element dispatch and intermediate buffer.
+        if src_max_len:
+            src = src[:src_max_len]
+        if tgt_max_len:
+            tgt = tgt[:tgt_max_len]
+
+        # Word strings that are not in the vocab get the lookup table's
+        # default_value integer.
+        src = tf.cast(vocab_table.lookup(src), tf.int32)
+        tgt = tf.cast(vocab_table.lookup(tgt), tf.int32)
+
+        # Create a tgt_input prefixed with <sos> and a tgt_output suffixed with <eos>.
+        tgt_in = tf.concat(([sos_id], tgt), 0)
+        tgt_out = tf.concat((tgt, [eos_id]), 0)
+
+        return src, tgt_in, tgt_out, tf.size(src), tf.size(tgt_in)
+
     src_tgt_dataset = src_tgt_dataset.map(
-        lambda src, tgt_in, tgt_out: (
-            src, tgt_in, tgt_out, tf.size(src), tf.size(tgt_in)),
+        transform,
         num_parallel_calls=num_parallel_calls).prefetch(output_buffer_size)
 
     # Bucket by source sequence length (buckets for lengths 0-9, 10-19, ...)
@@ -138,6 +136,9 @@ def get_iterator(dataset,
 
     else:
         batched_dataset = batching_func(src_tgt_dataset)
+    # Terminal prefetch: assembling and padding the next batch overlaps
+    # with the step consuming the current one.
+    batched_dataset = batched_dataset.prefetch(2)
     batched_iter = batched_dataset.make_initializable_iterator()
     (src_ids, tgt_input_ids, tgt_output_ids, src_seq_len,
      tgt_seq_len) = (batched_iter.get_next())
@@ -179,15 +180,15 @@ def get_infer_iterator(test_dataset,
         aggregated_src = tf.reduce_join([srcs], axis=0, separator=" ")
         return aggregated_src
 
-    test_dataset = test_dataset.map(tokenize)
-
-    if src_max_len:
-        test_dataset = test_dataset.map(lambda src: src[:src_max_len])
-    # Convert the word strings to ids
-    test_dataset = test_dataset.map(lambda src: tf.cast(vocab_table.lookup(src), tf.int32))
+    def transform(src):
+        # Truncation, vocab lookup and the word count fused into one map
+        # (see get_iterator).
+        if src_max_len:
+            src = src[:src_max_len]
+        src = tf.cast(vocab_table.lookup(src), tf.int32)
+        return src, tf.size(src)
 
-    # Add in the word counts.
-    test_dataset = test_dataset.map(lambda src: (src, tf.size(src)))
+    test_dataset = test_dataset.map(tokenize).map(transform)
 
     def batching_func(x):
         return x.padded_batch(
@@ -206,6 +207,9 @@ def get_infer_iterator(test_dataset,
                 0))  # src_len -- unused
 
     batched_dataset = batching_func(test_dataset)
+    # Terminal prefetch: assembling and padding the next batch overlaps
+    # with the step consuming the current one.
+    batched_dataset = batched_dataset.prefetch(2)
     batched_iter = batched_dataset.make_initializable_iterator()
     (src_ids, src_seq_len) = batched_iter.get_next()
     return BatchedInput(
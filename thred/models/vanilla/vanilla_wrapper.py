@@ -44,7 +44,7 @@ class VanillaNMTEncoderDecoder(NMTEncoderDecoderWrapper):
 
         # Log and output files
         log_file = os.path.join(out_dir, "log_%d" % time.time())
-        log_f = tf.gfile.GFile(log_file, mode="a")
+        log_f = log.open_log_file(log_file)
         log.print_out("# log_file=%s" % log_file, log_f)
 
         avg_step_time = 0.0
@@ -52,8 +52,13 @@ class VanillaNMTEncoderDecoder(NMTEncoderDecoderWrapper):
         # TensorFlow model
         config_proto = model_helper.get_config_proto(self.config.log_device)
 
+        # XLA only for the train session; the eval/infer graphs see varying
+        # shapes at every tick and would recompile over and over.
         train_sess = tf.Session(
-            target=target_session, config=config_proto, graph=train_model.graph)
+            target=target_session,
+            config=model_helper.get_config_proto(self.config.log_device,
+                                                 use_xla=self.config.use_xla),
+            graph=train_model.graph)
         eval_sess = tf.Session(
             target=target_session, config=config_proto, graph=eval_model.graph)
         infer_sess = tf.Session(
@@ -62,6 +67,7 @@ class VanillaNMTEncoderDecoder(NMTEncoderDecoderWrapper):
         with train_model.graph.as_default():
             loaded_train_model, global_step = model_helper.create_or_load_model(
                 train_model.model, model_dir, train_sess, "train")
+        loaded_train_model.reset_streaming_stats(train_sess)
 
         # Summary writer
         summary_writer = tf.summary.FileWriter(
@@ -98,7 +104,10 @@ class VanillaNMTEncoderDecoder(NMTEncoderDecoderWrapper):
             feed_dict={train_model.skip_count_placeholder: skip_count})
 
         pbar = trange(self.config.num_train_steps, initial=global_step)
-        pbar.set_postfix(lr=lr, wps='0K', ppl='inf', gN='inf', best_dev_ppl=self.config.best_dev_ppl)
+        pbar.set_postfix_str(
+            "lr={:.2e}, wps=0K, ppl=inf, best_dev_ppl={:.3f}, gN=inf".format(
+                lr, self.config.best_dev_ppl),
+            refresh=False)
         pbar.set_description("Ep {}/{}".format(self.config.epoch, self.config.num_train_epochs))
 
         while self.config.epoch < self.config.num_train_epochs and patience > 0:
@@ -133,9 +142,11 @@ class VanillaNMTEncoderDecoder(NMTEncoderDecoderWrapper):
 
             # Once in a while, we print statistics.
             if global_step - last_stats_step >= steps_per_stats:
-                train_ppl, speed, is_overflow = self.check_stats(stats, global_step, steps_per_stats, log_f, pbar)
+                train_ppl, speed, is_overflow = self.check_stats(
+                    stats, loaded_train_model, train_sess, global_step, steps_per_stats, log_f, pbar)
                 pbar.update(global_step - last_stats_step)
                 last_stats_step = global_step
+                log_f.flush()
 
                 if is_overflow:
                     break
@@ -213,6 +224,7 @@ class VanillaNMTEncoderDecoder(NMTEncoderDecoderWrapper):
                 (test_ppl, self.config.beam_width, self.config.length_penalty_weight, self.config.sampling_temperature),
                 log_f)
 
+        log_f.close()
         summary_writer.close()
 
         return (dev_scores, test_scores, dev_ppl, test_ppl, global_step)
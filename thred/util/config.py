@@ -1,5 +1,8 @@
+import atexit
 import os
+import queue
 import shutil
+import threading
 from pathlib import Path
 
 import yaml
@@ -7,6 +10,79 @@ import yaml
 from . import fs, log
 
 
+class _AsyncConfigWriter:
+    """Writes config snapshots on a background thread.
+
+    `Config.save` runs at every epoch boundary and eval tick, and the yaml
+    dump plus disk write stalls the training loop for no good reason. The
+    caller hands over a plain-dict snapshot through a single-slot queue (a
+    newer snapshot displaces a stale queued one) and the worker writes it to
+    a temp file followed by `os.replace`, so a crash mid-write never leaves
+    a truncated config behind.
+    """
+
+    def __init__(self):
+        self._queue = queue.Queue(maxsize=1)
+        self._thread = None
+        self._error = None
+
+    def submit(self, hparams_file, config_dict):
+        if self._error is not None:
+            # Surface the failure of an earlier write where the old
+            # synchronous code would have raised.
+            error, self._error = self._error, None
+            raise error
+
+        if self._thread is None:
+            self._thread = threading.Thread(
+                target=self._run, name="config-writer", daemon=True)
+            self._thread.start()
+            atexit.register(self.wait)
+
+        while True:
+            try:
+                self._queue.put_nowait((hparams_file, config_dict))
+                return
+            except queue.Full:
+                try:
+                    # Drop the stale snapshot; the new one supersedes it.
+                    self._queue.get_nowait()
+                    self._queue.task_done()
+                except queue.Empty:
+                    pass
+
+    def wait(self):
+        if self._thread is not None:
+            self._queue.join()
+        if self._error is not None:
+            error, self._error = self._error, None
+            raise error
+
+    def _run(self):
+        while True:
+            hparams_file, config_dict = self._queue.get()
+            try:
+                self._write(hparams_file, config_dict)
+            except Exception as e:
+                # Keep the worker alive: if it died here, later submits
+                # would enqueue snapshots nobody drains and the atexit
+                # wait() would block forever on queue.join().
+                self._error = e
+                log.print_out("  >> Failed to save config to {}: {}".format(hparams_file, e))
+            finally:
+                self._queue.task_done()
+
+    @staticmethod
+    def _write(hparams_file, config_dict):
+        tmp_file = hparams_file.with_name(hparams_file.name + ".tmp")
+        with tmp_file.open("w", encoding="utf-8") as f:
+            yaml.dump(config_dict, f, default_flow_style=False)
+        os.replace(str(tmp_file), str(hparams_file))
+
+
+_config_writer = _AsyncConfigWriter()
+
+
 class Config(dict):
 
     def __init__(self, *args, **kwargs) -> None:
@@ -110,8 +186,9 @@ class Config(dict):
         if config_dict.get('best_dev_ppl_dir', ''):
             config_dict['best_dev_ppl_dir'] = Path(config_dict['best_dev_ppl_dir']).name
 
-        with hparams_file.open("w", encoding="utf-8") as f:
-            yaml.dump(config_dict, f, default_flow_style=False)
+        # The snapshot above is fully detached from `self`, so the write can
+        # proceed off-thread while training carries on.
+        _config_writer.submit(hparams_file, config_dict)
 
     def _update_relative_paths(self, args):
         model_path = Path(self["model_dir"])
@@ -135,7 +212,7 @@ def _cleanup(folder):
     for f in os.listdir(folder):
         file = os.path.join(folder, f)
 
-        if '.ckpt' in f or f.startswith('log_') or \
+        if '.ckpt' in f or '.cache' in f or f.startswith('log_') or \
                 f.lower() == 'checkpoint' or \
                 f.endswith('.shuf') or \
                 f.endswith('_config.yml'):
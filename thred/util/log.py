@@ -4,6 +4,23 @@ import time
 import tensorflow as tf
 
 
+_REMOTE_PREFIXES = ("gs://", "hdfs://", "s3://")
+
+
+def open_log_file(log_file, buffering=1 << 16):
+    """Open a log file for appending.
+
+    Local files bypass the `tf.gfile` abstraction and its per-write wrapper
+    overhead; the large buffer keeps syscalls off the training hot loop
+    (callers flush at their stats boundary). Remote destinations still go
+    through `tf.gfile`.
+    """
+    if log_file.startswith(_REMOTE_PREFIXES):
+        return tf.gfile.GFile(log_file, mode="ab")
+
+    return open(log_file, mode="ab", buffering=buffering)
+
+
 def print_time(s, start_time):
     """Take a start time, print elapsed duration, and return a new time."""
 